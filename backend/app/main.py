@@ -1,69 +1,97 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import os
+import time
+import uuid
+import queue
+import atexit
+import hashlib
+import functools
 import asyncio
-from typing import Optional
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from typing import Final, Optional
 from dotenv import load_dotenv
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
+from cachetools import TTLCache
+import orjson
 
 # Google ADK imports
 from google.genai import types
 from google.adk.agents import Agent
+from google.adk.models import Gemini, LlmRequest
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
+from google.adk.sessions import InMemorySessionService, Session
 
 # Add parent directory to path for imports
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from config.settings import settings
 from utils.mcp_manager import get_mcp_manager
 
 # Load environment variables
 load_dotenv('config/.env')
 
+# Logging - handlers write from a background thread so the event loop never blocks on stdout
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+logging.basicConfig(level=settings.LOG_LEVEL, handlers=[QueueHandler(_log_queue)])
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger(__name__)
+
 # Simplified globals - MCP manager handles most state
 _agent_instance = None
 _session_service = None
 _runner_instance = None
 
-async def get_mcp_tools():
-    """Get MCP tools using the connection manager."""
-    try:
-        mcp_manager = await get_mcp_manager()
-        toolset = await mcp_manager.connect()
-        return [toolset] if toolset else []
-    except Exception as e:
-        print(f"❌ Error getting MCP tools: {e}")
-        return []
+# Init locks - concurrent first requests build each shared object only once
+_agent_lock = asyncio.Lock()
+_session_service_lock = asyncio.Lock()
+_runner_lock = asyncio.Lock()
 
-async def cleanup_mcp():
-    """Cleanup MCP connection on exit."""
-    try:
-        mcp_manager = await get_mcp_manager()
-        await mcp_manager.disconnect()
-        print("✅ MCP cleanup completed")
-    except Exception as e:
-        print(f"⚠️ MCP cleanup warning: {e}")
+APP_NAME = 'adk_mcp_fastapi'
 
-async def get_agent_async():
-    """Creates an ADK Agent equipped with tools from the MCP Server."""
-    global _agent_instance
-    
-    if _agent_instance is not None:
-        return _agent_instance
-    
-    try:
-        # Get MCP tools
-        tools = await get_mcp_tools()
-        print(f"🛠️ Fetched {len(tools)} tools from MCP server.")
-        
-        # Create agent with proper parameters for current ADK version
-        _agent_instance = Agent(
-            model="gemini-2.0-flash",
-            name="brightdata_mcp_professional_agent",
-            instruction="""You are a PROACTIVE web scraping and data extraction specialist powered by BrightData MCP tools and Google ADK.
+# Session cache - one ADK session per client session_id (LRU + idle TTL)
+SESSION_CACHE_MAX_SIZE = 1024
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '3600'))
+_session_cache: "OrderedDict[str, tuple[Session, float]]" = OrderedDict()
+# Per-session_id locks - only requests for the same conversation wait on each other
+_session_locks: dict[str, asyncio.Lock] = {}
+
+WARMUP_TIMEOUT_SECONDS = 10
+
+QUICK_USER_ID = 'quick_user'
+
+# Response cache - identical /quick-compare queries within the TTL skip the agent run entirely.
+# /chat is never cached: its answers depend on the session's conversation so far.
+# All access happens on the event loop with no await in between, so no lock is needed.
+RESPONSE_CACHE_MAX_SIZE = 1024
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300'))
+_response_cache: TTLCache = TTLCache(maxsize=RESPONSE_CACHE_MAX_SIZE, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+# Concurrency cap - bounds simultaneous agent runs hitting the single MCP upstream
+MCP_MAX_CONCURRENCY = int(os.getenv('MCP_MAX_CONCURRENCY', '8'))
+_mcp_semaphore = asyncio.Semaphore(MCP_MAX_CONCURRENCY)
+_mcp_slots = {"active": 0, "waiting": 0}
+
+# In-flight queries - concurrent identical requests await the same agent run
+_inflight: dict[str, asyncio.Task] = {}
+
+# Shared LLM - a model given by name is re-resolved into a fresh Gemini client
+# (and HTTP connection pool) on every LLM call, so build one and reuse it
+_gemini_model = Gemini(model=settings.MODEL_NAME)
+
+# Agent instructions - built once at import and shared by every agent construction
+_SYSTEM_INSTRUCTION: Final[str] = """You are a PROACTIVE web scraping and data extraction specialist powered by BrightData MCP tools and Google ADK.
 
 🚨 CRITICAL BEHAVIOR RULES:
 1. NEVER ask users for additional parameters or specifications
@@ -259,42 +287,126 @@ For any comparison query (vs, versus, compare), ALWAYS create a markdown table:
 - [Article 1](url) - Source Name
 - [Article 2](url) - Source Name
 
-Always extract REAL, CURRENT data using your MCP tools. Never provide placeholder data.""",
-            tools=tools,
-        )
-        return _agent_instance
-    except Exception as e:
-        print(f"❌ Error creating agent: {e}")
-        # Fallback agent without MCP tools
-        _agent_instance = Agent(
-            model="gemini-2.0-flash", 
-            name="basic_assistant",
-            instruction="You are a helpful assistant. Note: Advanced web scraping tools are currently unavailable.",
-        )
-        return _agent_instance
+Always extract REAL, CURRENT data using your MCP tools. Never provide placeholder data."""
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Handle application startup and shutdown with simplified MCP management"""
-    print("🚀 Starting Google ADK FastAPI MCP Agent...")
+_FALLBACK_INSTRUCTION: Final[str] = "You are a helpful assistant. Note: Advanced web scraping tools are currently unavailable."
+
+async def get_mcp_tools():
+    """Get MCP tools using the connection manager."""
+    mcp_manager = get_mcp_manager()
+    try:
+        # Spawn the MCP server and finish its handshake now, not on the first user request
+        await mcp_manager.warm()
+    except Exception as e:
+        logger.error("❌ Error getting MCP tools: %s", e)
     
+    # Handed to the agent even if that failed: it reconnects with backoff on later tool lookups
+    return [mcp_manager.agent_toolset]
+
+async def cleanup_mcp():
+    """Cleanup MCP connection on exit."""
     try:
-        # Initialize agent (which will get MCP tools)
-        agent = await get_agent_async()
-        print(f"🎉 Agent initialized: {agent.name}")
-        print("🚀 FastAPI MCP Agent is ready!")
+        mcp_manager = get_mcp_manager()
+        await mcp_manager.disconnect()
+        logger.info("✅ MCP cleanup completed")
     except Exception as e:
-        print(f"⚠️ Startup warning: {e}")
-        print("🚀 FastAPI Agent ready with fallback configuration")
+        logger.warning("⚠️ MCP cleanup warning: %s", e)
+
+async def get_agent_async():
+    """Creates an ADK Agent equipped with tools from the MCP Server."""
+    global _agent_instance
     
-    yield  # Application runs here
+    if _agent_instance is not None:
+        return _agent_instance
     
-    # Graceful shutdown
-    print("🧹 Shutting down gracefully...")
+    async with _agent_lock:
+        # Another request may have finished building the agent while we waited
+        if _agent_instance is not None:
+            return _agent_instance
+        
+        try:
+            # Get MCP tools
+            tools = await get_mcp_tools()
+            logger.info("🛠️ MCP toolset attached (connected: %s)", get_mcp_manager().is_connected)
+            
+            # Create agent with proper parameters for current ADK version
+            _agent_instance = Agent(
+                model=_gemini_model,
+                name="brightdata_mcp_professional_agent",
+                instruction=_SYSTEM_INSTRUCTION,
+                tools=tools,
+            )
+            return _agent_instance
+        except Exception as e:
+            logger.error("❌ Error creating agent: %s", e)
+            # Fallback agent without MCP tools
+            _agent_instance = Agent(
+                model=_gemini_model,
+                name="basic_assistant",
+                instruction=_FALLBACK_INSTRUCTION,
+            )
+            return _agent_instance
+
+async def _warmup():
+    """Send one tiny tool-free model request so TLS and auth to Gemini are hot for the first user"""
+    # The MCP handshake already ran while the agent was built; going through the agent here
+    # would let its always-use-tools prompt trigger paid scrapes on every worker start
     try:
-        await cleanup_mcp()
+        request = LlmRequest(
+            model=settings.MODEL_NAME,
+            contents=[_user_content("ping")],
+            config=types.GenerateContentConfig(max_output_tokens=1)
+        )
+        # No MCP involved, so this stays out of the MCP concurrency slots
+        async with asyncio.timeout(WARMUP_TIMEOUT_SECONDS):
+            async for _ in _gemini_model.generate_content_async(request):
+                pass
+        logger.info("🔥 Warmup request completed")
     except Exception as e:
-        print(f"⚠️ Cleanup warning: {e}")
+        logger.warning("⚠️ Warmup skipped: %r", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Handle application startup and shutdown with simplified MCP management"""
+    logger.info("🚀 Starting Google ADK FastAPI MCP Agent...")
+    
+    # Probes read connection state from here instead of calling the manager getter
+    app.state.mcp_manager = get_mcp_manager()
+    
+    async with AsyncExitStack() as stack:
+        # The MCP session lives exactly as long as the app and is closed last
+        stack.push_async_callback(cleanup_mcp)
+        
+        try:
+            # Build the agent (MCP handshake) while the session store comes up
+            agent, _ = await asyncio.gather(
+                get_agent_async(),
+                get_shared_session_service()
+            )
+            logger.info("🎉 Agent initialized: %s", agent.name)
+            
+            # Warm the runner so the first request doesn't pay for it
+            await get_shared_runner()
+            logger.info("🏃 Shared runner initialized")
+            logger.info("🚀 FastAPI MCP Agent is ready!")
+        except Exception as e:
+            logger.warning("⚠️ Startup warning: %s", e)
+            logger.info("🚀 FastAPI Agent ready with fallback configuration")
+        
+        # Warm the Gemini connection in the background without delaying startup
+        warmup_task = asyncio.create_task(_warmup()) if settings.WARMUP_ON_STARTUP else None
+        
+        yield  # Application runs here
+        
+        # Graceful shutdown
+        logger.info("🧹 Shutting down gracefully...")
+        if warmup_task is not None:
+            warmup_task.cancel()
+        if hasattr(_session_service, 'close'):
+            try:
+                await _session_service.close()
+            except Exception as e:
+                logger.warning("⚠️ Session store cleanup warning: %s", e)
 
 
 
@@ -347,6 +459,7 @@ app = FastAPI(
             "description": "Development server"
         }
     ],
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -362,22 +475,16 @@ app.add_middleware(
 # Pydantic models
 class ChatMessage(BaseModel):
     message: str
-    session_id: Optional[str] = "default"
+    # Omit to start a new conversation; send back the returned session_id to continue it
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
     status: str = "success"
 
-@app.get("/")
-async def root():
-    """Root endpoint with API information"""
-    try:
-        mcp_manager = await get_mcp_manager()
-        tools_count = 1 if mcp_manager.is_connected else 0
-    except:
-        tools_count = 0
-    
+def _root_info(tools_count: int) -> dict:
+    """API information returned by the root endpoint"""
     return {
         "status": "online",
         "name": "BrightData MCP × Google ADK Platform",
@@ -395,6 +502,7 @@ async def root():
         ],
         "endpoints": {
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "quick_compare": "/quick-compare",
             "health": "/health",
             "mcp_status": "/mcp/status",
@@ -409,16 +517,29 @@ async def root():
         "repository": "https://github.com/arjunprabhulal/brightdata-mcp-adk-hackathon"
     }
 
+# The root payload only varies with MCP connectivity, so serialize both variants once
+_ROOT_JSON_CONNECTED = orjson.dumps(_root_info(1))
+_ROOT_JSON_DISCONNECTED = orjson.dumps(_root_info(0))
+
+# Probe payload until lifespan sets app.state.mcp_manager (still starting, or failed part-way)
+_STARTING_RESPONSE = {"status": "starting", "mcp_connected": False}
+
+@app.get("/")
+async def root():
+    """Root endpoint with API information"""
+    mcp_manager = getattr(app.state, "mcp_manager", None)
+    return Response(
+        content=_ROOT_JSON_CONNECTED if mcp_manager and mcp_manager.is_connected else _ROOT_JSON_DISCONNECTED,
+        media_type="application/json"
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    try:
-        mcp_manager = await get_mcp_manager()
-        mcp_connected = mcp_manager.is_connected
-        tools_count = 1 if mcp_connected else 0
-    except:
-        mcp_connected = False
-        tools_count = 0
+    if (mcp_manager := getattr(app.state, "mcp_manager", None)) is None:
+        return ORJSONResponse(_STARTING_RESPONSE, status_code=503)
+    mcp_connected = mcp_manager.is_connected
+    tools_count = 1 if mcp_connected else 0
     
     return {
         "status": "healthy",
@@ -426,27 +547,28 @@ async def health_check():
         "mcp_connected": mcp_connected,
         "mcp_status": "connected" if mcp_connected else "disconnected",
         "tools_count": tools_count,
-        "google_api_configured": bool(os.getenv('GEMINI_API_KEY')),
-        "brightdata_api_configured": bool(os.getenv('BRIGHTDATA_API_TOKEN')),
-        "browser_auth_configured": bool(os.getenv('BROWSER_AUTH'))
+        "google_api_configured": bool(settings.GEMINI_API_KEY),
+        "brightdata_api_configured": bool(settings.BRIGHTDATA_API_TOKEN),
+        "browser_auth_configured": bool(settings.BROWSER_AUTH)
     }
 
 @app.get("/mcp/status")
 async def mcp_status():
     """Detailed MCP connection status"""
-    try:
-        mcp_manager = await get_mcp_manager()
-        mcp_connected = mcp_manager.is_connected
-        tools_count = 1 if mcp_connected else 0
-    except:
-        mcp_connected = False
-        tools_count = 0
+    if (mcp_manager := getattr(app.state, "mcp_manager", None)) is None:
+        return ORJSONResponse(_STARTING_RESPONSE, status_code=503)
+    mcp_connected = mcp_manager.is_connected
+    tools_count = 1 if mcp_connected else 0
     
     return {
         "mcp_initialized": mcp_connected,
         "mcp_tools_available": mcp_connected,
         "tools_count": tools_count,
         "agent_available": _agent_instance is not None,
+        "agent_concurrency": {
+            "limit": MCP_MAX_CONCURRENCY,
+            **_mcp_slots
+        },
         "known_issues": {
             "list_roots_not_supported": {
                 "description": "BrightData MCP server doesn't implement list_roots method",
@@ -456,66 +578,257 @@ async def mcp_status():
         }
     }
 
+def _create_session_service():
+    """Use Redis when REDIS_URL is set so all workers share sessions"""
+    redis_url = os.getenv('REDIS_URL')
+    if not redis_url:
+        return InMemorySessionService()
+    
+    import redis.asyncio as redis
+    from utils.redis_session_service import RedisSessionService
+    
+    logger.info("🗄️ Using Redis session store")
+    return RedisSessionService(
+        redis.from_url(redis_url),
+        ttl_seconds=SESSION_TTL_SECONDS
+    )
+
 async def get_shared_session_service():
-    """Get or create shared session service to avoid resource duplication"""
+    """Get shared session service (built at startup, created here only as a fallback)"""
     global _session_service
     if _session_service is None:
-        _session_service = InMemorySessionService()
+        async with _session_service_lock:
+            if _session_service is None:
+                _session_service = _create_session_service()
     return _session_service
 
 async def get_shared_runner():
-    """Get or create shared runner to avoid process duplication"""
+    """Get shared runner (built at startup, created here only as a fallback)"""
     global _runner_instance
     if _runner_instance is None:
-        agent = await get_agent_async()
-        session_service = await get_shared_session_service()
-        _runner_instance = Runner(
-            app_name='adk_mcp_fastapi',
-            agent=agent,
-            session_service=session_service,
-        )
+        async with _runner_lock:
+            if _runner_instance is None:
+                agent = await get_agent_async()
+                session_service = await get_shared_session_service()
+                _runner_instance = Runner(
+                    app_name=APP_NAME,
+                    agent=agent,
+                    session_service=session_service,
+                )
     return _runner_instance
 
+async def _drop_session(session_service, session: Session):
+    """Remove an evicted or finished session from an in-memory session service"""
+    # Shared stores expire sessions on their own and other workers may still use them
+    if not isinstance(session_service, InMemorySessionService):
+        return
+    
+    try:
+        await session_service.delete_session(
+            app_name=APP_NAME,
+            user_id=session.user_id,
+            session_id=session.id
+        )
+    except Exception as e:
+        logger.warning("⚠️ Session cleanup warning: %s", e)
+
+def _resolve_session_id(message: ChatMessage) -> tuple[str, bool]:
+    """Return the client's session_id, or a fresh one (flagged new) when it sent none"""
+    if message.session_id:
+        return message.session_id, False
+    return uuid.uuid4().hex, True
+
+def _touch_cached_session(session_id: str) -> Optional[Session]:
+    """Return the cached session if it is still fresh and mark it recently used"""
+    cached = _session_cache.get(session_id)
+    if cached is None:
+        return None
+    
+    session, last_used = cached
+    now = time.monotonic()
+    if now - last_used >= SESSION_TTL_SECONDS:
+        return None
+    
+    _session_cache[session_id] = (session, now)
+    _session_cache.move_to_end(session_id)
+    return session
+
+async def get_or_create_session(session_id: str, user_id: str, is_new: bool = False) -> Session:
+    """Reuse the ADK session for a client session_id, creating it on first use"""
+    if not is_new and (session := _touch_cached_session(session_id)) is not None:
+        return session
+    
+    session_service = await get_shared_session_service()
+    lock = _session_locks.setdefault(session_id, asyncio.Lock())
+    try:
+        async with lock:
+            # Another request for this session_id may have created it while we waited
+            if (session := _touch_cached_session(session_id)) is not None:
+                return session
+            
+            if (stale := _session_cache.pop(session_id, None)) is not None:
+                # Idle for too long - start a fresh conversation
+                await _drop_session(session_service, stale[0])
+            
+            # Another worker may already hold this session in a shared store;
+            # ids we just generated can't exist anywhere yet
+            session = None if is_new else await session_service.get_session(
+                app_name=APP_NAME,
+                user_id=user_id,
+                session_id=session_id
+            )
+            if session is None:
+                session = await session_service.create_session(
+                    state={},
+                    app_name=APP_NAME,
+                    user_id=user_id,
+                    session_id=session_id
+                )
+            _session_cache[session_id] = (session, time.monotonic())
+            
+            # Evict least recently used sessions beyond the cap
+            evicted = []
+            while len(_session_cache) > SESSION_CACHE_MAX_SIZE:
+                evicted.append(_session_cache.popitem(last=False)[1][0])
+            for old_session in evicted:
+                await _drop_session(session_service, old_session)
+            
+            return session
+    finally:
+        # Waiters still hold their reference, and they re-check the cache anyway
+        if _session_locks.get(session_id) is lock and not lock.locked():
+            del _session_locks[session_id]
+
+def _response_cache_key(scope: str, message: str) -> str:
+    """Build a cache key from the query scope and the normalized message"""
+    normalized = f"{scope}\x00{message.strip().lower()}"
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+def _inflight_done(key: str, task: asyncio.Task):
+    """Forget a finished shared run and mark its error retrieved if every caller already left"""
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()
+
+async def _singleflight(key: str, work):
+    """Run work() once per key; concurrent callers with the same key share its result"""
+    if (task := _inflight.get(key)) is None:
+        # Its own task, so the caller that started it leaving doesn't cancel it for the others
+        task = asyncio.ensure_future(work())
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_inflight_done, key))
+    
+    # Shield so any one caller disconnecting only stops its own wait
+    return await asyncio.shield(task)
+
+@asynccontextmanager
+async def _mcp_slot():
+    """Hold one of the MCP_MAX_CONCURRENCY agent run slots"""
+    _mcp_slots["waiting"] += 1
+    try:
+        await _mcp_semaphore.acquire()
+    finally:
+        _mcp_slots["waiting"] -= 1
+    
+    _mcp_slots["active"] += 1
+    try:
+        yield
+    finally:
+        _mcp_slots["active"] -= 1
+        _mcp_semaphore.release()
+
+def _user_content(text: str) -> types.Content:
+    """Build a fresh user message content - ADK stores it in the session's event history"""
+    return types.Content(role='user', parts=[types.Part(text=text)])
+
+def _iter_event_text(event):
+    """Yield the text pieces carried by an ADK runner event"""
+    # Text lives on event.content, event.message(.content) or event.text
+    if (content := getattr(event, 'content', None)) is None:
+        message = getattr(event, 'message', None)
+        if isinstance(message, str):
+            if message:
+                yield message
+            return
+        content = getattr(message, 'content', None)
+    
+    if content is None:
+        if (text := getattr(event, 'text', None)):
+            yield str(text)
+    elif isinstance(content, str):
+        yield content
+    elif (parts := getattr(content, 'parts', None)):
+        for part in parts:
+            if (text := getattr(part, 'text', None)):
+                yield str(text)
+    elif (text := getattr(content, 'text', None)):
+        yield str(text)
+
 @app.post("/quick-compare")
 async def quick_compare(platforms: str = "booking vs airbnb", location: str = "New York"):
     """Quick comparison endpoint with 30-second timeout"""
     try:
         quick_message = ChatMessage(
-            message=f"Quick comparison: {platforms} in {location}. Use search_engine only for speed, provide results within 30 seconds.",
-            session_id="quick"
+            message=f"Quick comparison: {platforms} in {location}. Use search_engine only for speed, provide results within 30 seconds."
         )
         
         # Use shorter timeout for quick comparisons
         timeout_seconds = 30
         
-        session_service = await get_shared_session_service()
-        runner = await get_shared_runner()
-        
-        session = await session_service.create_session(
-            state={}, 
-            app_name='adk_mcp_fastapi', 
-            user_id='quick_user'
-        )
-        
-        response_text = ""
-        content = types.Content(role='user', parts=[types.Part(text=quick_message.message)])
+        cache_key = _response_cache_key("quick-compare", quick_message.message)
+        if (cached := _response_cache.get(cache_key)) is not None:
+            logger.info("⚡ Serving cached quick comparison")
+            return {
+                "response": cached,
+                "timeout_seconds": timeout_seconds,
+                "status": "success"
+            }
         
-        async def run_quick_agent():
-            nonlocal response_text
-            async for event in runner.run_async(
-                session_id=session.id,
-                user_id=session.user_id,
-                new_message=content
-            ):
-                if hasattr(event, 'content') and hasattr(event.content, 'parts'):
-                    for part in event.content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            response_text += str(part.text) + "\n"
+        async def run_quick_compare() -> str:
+            runner = await get_shared_runner()
+            session_service = await get_shared_session_service()
+            
+            # Every comparison gets a throwaway session so no history leaks between callers
+            session = await session_service.create_session(
+                state={},
+                app_name=APP_NAME,
+                user_id=QUICK_USER_ID
+            )
+            
+            response_parts: list[str] = []
+            content = _user_content(quick_message.message)
+            
+            async def run_quick_agent():
+                async with _mcp_slot():
+                    async for event in runner.run_async(
+                        session_id=session.id,
+                        user_id=session.user_id,
+                        new_message=content
+                    ):
+                        response_parts.extend(_iter_event_text(event))
+            
+            try:
+                async with asyncio.timeout(timeout_seconds):
+                    await run_quick_agent()
+                timed_out = False
+            except TimeoutError:
+                response_parts.append(f"\n⚡ **Quick comparison completed** in {timeout_seconds} seconds.")
+                timed_out = True
+            finally:
+                # Frees in-memory sessions; shared stores expire them without an extra round trip
+                await _drop_session(session_service, session)
+            
+            response_text = "\n".join(response_parts)
+            
+            # Only cache complete results, never partial ones cut off by the timeout
+            if not timed_out and response_text.strip():
+                _response_cache[cache_key] = response_text.strip()
+            
+            return response_text
         
-        try:
-            await asyncio.wait_for(run_quick_agent(), timeout=timeout_seconds)
-        except asyncio.TimeoutError:
-            response_text += f"\n\n⚡ **Quick comparison completed** in {timeout_seconds} seconds."
+        # Identical comparisons already in flight share one agent run
+        response_text = await _singleflight(cache_key, run_quick_compare)
         
         return {
             "response": response_text.strip() or "Quick comparison completed - check results above",
@@ -533,102 +846,151 @@ async def chat(message: ChatMessage):
         if not message.message.strip():
             raise HTTPException(status_code=400, detail="No message provided")
         
-        print(f"💬 Processing query: {message.message}")
+        logger.info("💬 Processing query: %s", message.message)
         
-        # Use shared services to avoid duplicate processes
-        session_service = await get_shared_session_service()
-        runner = await get_shared_runner()
+        # Only dedupes concurrent double-submits; the turn still runs in (and is recorded by) the session
+        session_id, is_new = _resolve_session_id(message)
+        inflight_key = _response_cache_key(f"chat:{session_id}", message.message)
         
-        # Create session for this request
-        session = await session_service.create_session(
-            state={}, 
-            app_name='adk_mcp_fastapi', 
-            user_id=f'user_{message.session_id}'
-        )
-        
-        # Process the query with timeout
-        response_text = ""
-        timeout_seconds = 90  # 90 second timeout for the entire request
-        
-        try:
-            # Create the message content
-            content = types.Content(role='user', parts=[types.Part(text=message.message)])
+        async def run_chat() -> str:
+            # Use shared services to avoid duplicate processes
+            runner = await get_shared_runner()
             
-            # Run the agent with timeout
-            async def run_agent_with_events():
-                nonlocal response_text
-                async for event in runner.run_async(
-                    session_id=session.id,
-                    user_id=session.user_id,
-                    new_message=content
-                ):
-                    print(f"📤 Event type: {type(event).__name__}")
-                    
-                    # Extract response from different event types (same logic as Flask app)
-                    if hasattr(event, 'content'):
-                        if hasattr(event.content, 'parts'):
-                            for part in event.content.parts:
-                                if hasattr(part, 'text') and part.text:
-                                    response_text += str(part.text) + "\n"
-                        elif hasattr(event.content, 'text') and event.content.text:
-                            response_text += str(event.content.text) + "\n"
-                        elif isinstance(event.content, str):
-                            response_text += event.content + "\n"
-                    
-                    elif hasattr(event, 'message') and event.message:
-                        if hasattr(event.message, 'content'):
-                            if hasattr(event.message.content, 'parts'):
-                                for part in event.message.content.parts:
-                                    if hasattr(part, 'text') and part.text:
-                                        response_text += str(part.text) + "\n"
-                            elif hasattr(event.message.content, 'text') and event.message.content.text:
-                                response_text += str(event.message.content.text) + "\n"
-                        elif isinstance(event.message, str):
-                            response_text += event.message + "\n"
-                    
-                    elif hasattr(event, 'text') and event.text:
-                        response_text += str(event.text) + "\n"
+            # Reuse the session for this client so the conversation carries over
+            session = await get_or_create_session(session_id, f'user_{session_id}', is_new)
+            
+            # Process the query with timeout
+            response_parts: list[str] = []
+            timeout_seconds = 90  # 90 second timeout for the entire request
             
-            # Execute with timeout
             try:
-                await asyncio.wait_for(run_agent_with_events(), timeout=timeout_seconds)
-            except asyncio.TimeoutError:
-                print(f"⏱️ Request timed out after {timeout_seconds} seconds")
-                if response_text.strip():
-                    response_text += f"\n\n⏱️ **Note**: Request timed out after {timeout_seconds} seconds. Showing partial results gathered so far."
-                else:
-                    response_text = f"⏱️ **Request timed out** after {timeout_seconds} seconds. The comparison is taking longer than expected. Please try a more specific query or try again later."
-        
-        except Exception as e:
-            print(f"❌ Error during agent execution: {e}")
-            response_text = f"I encountered an error while processing your request: {str(e)}"
-        
-        # Clean up the response
-        response_text = response_text.strip()
+                # Create the message content
+                content = _user_content(message.message)
+                
+                # Run the agent with timeout
+                async def run_agent_with_events():
+                    async with _mcp_slot():
+                        async for event in runner.run_async(
+                            session_id=session.id,
+                            user_id=session.user_id,
+                            new_message=content
+                        ):
+                            logger.debug("📤 Event type: %s", type(event).__name__)
+                            
+                            response_parts.extend(_iter_event_text(event))
+                
+                # Execute with timeout
+                try:
+                    async with asyncio.timeout(timeout_seconds):
+                        await run_agent_with_events()
+                except TimeoutError:
+                    logger.warning("⏱️ Request timed out after %s seconds", timeout_seconds)
+                    if any(part.strip() for part in response_parts):
+                        response_parts.append(f"\n⏱️ **Note**: Request timed out after {timeout_seconds} seconds. Showing partial results gathered so far.")
+                    else:
+                        response_parts = [f"⏱️ **Request timed out** after {timeout_seconds} seconds. The comparison is taking longer than expected. Please try a more specific query or try again later."]
+            
+            except Exception as e:
+                logger.error("❌ Error during agent execution: %s", e)
+                response_parts = [f"I encountered an error while processing your request: {str(e)}"]
+            
+            # Join once and clean up the response
+            response_text = "\n".join(response_parts).strip()
+            
+            # If no response, provide a fallback
+            if not response_text:
+                response_text = "I processed your request, but I'm having trouble generating a response. Please try again or rephrase your question."
+            
+            return response_text
         
-        # If no response, provide a fallback
-        if not response_text:
-            response_text = "I processed your request, but I'm having trouble generating a response. Please try again or rephrase your question."
+        # Identical queries already in flight for this session share one agent run
+        response_text = await _singleflight(inflight_key, run_chat)
         
-        print(f"📨 Final response: {response_text}")
+        logger.debug("📨 Final response: %s", response_text)
         
         return ChatResponse(
             response=response_text,
-            session_id=message.session_id,
+            session_id=session_id,
             status="success"
         )
         
     except Exception as e:
-        print(f"💥 Unexpected error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("💥 Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """Streaming chat endpoint - sends agent output as NDJSON lines as soon as it arrives"""
+    if not message.message.strip():
+        raise HTTPException(status_code=400, detail="No message provided")
+    
+    logger.info("💬 Streaming query: %s", message.message)
+    
+    runner = await get_shared_runner()
+    session_id, is_new = _resolve_session_id(message)
+    session = await get_or_create_session(session_id, f'user_{session_id}', is_new)
+    
+    timeout_seconds = 90
+    content = _user_content(message.message)
+    chunks: asyncio.Queue = asyncio.Queue()
+    
+    async def run_agent_into_chunks():
+        async def forward_events():
+            async with _mcp_slot():
+                async for event in runner.run_async(
+                    session_id=session.id,
+                    user_id=session.user_id,
+                    new_message=content
+                ):
+                    for text in _iter_event_text(event):
+                        chunks.put_nowait({"type": "chunk", "text": text})
+        
+        try:
+            async with asyncio.timeout(timeout_seconds):
+                await forward_events()
+        except TimeoutError:
+            logger.warning("⏱️ Stream timed out after %s seconds", timeout_seconds)
+            chunks.put_nowait({
+                "type": "timeout",
+                "text": f"⏱️ **Note**: Request timed out after {timeout_seconds} seconds. Showing partial results gathered so far."
+            })
+        except Exception as e:
+            logger.error("❌ Error during agent execution: %s", e)
+            chunks.put_nowait({
+                "type": "error",
+                "text": f"I encountered an error while processing your request: {str(e)}"
+            })
+        finally:
+            chunks.put_nowait(None)
+    
+    async def event_stream():
+        # Run the agent in its own task so a slow client never stalls it
+        producer = asyncio.create_task(run_agent_into_chunks())
+        try:
+            while (item := await chunks.get()) is not None:
+                yield orjson.dumps(item) + b"\n"
+            yield orjson.dumps({"type": "done", "session_id": session_id}) + b"\n"
+        finally:
+            producer.cancel()
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 
 
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting FastAPI server...")
-    print(f"Google API Key configured: {'Yes' if os.getenv('GEMINI_API_KEY') else 'No'}")
-    print(f"Bright Data API Token configured: {'Yes' if os.getenv('BRIGHTDATA_API_TOKEN') else 'No'}")
-    uvicorn.run(app, host="0.0.0.0", port=8001) 
\ No newline at end of file
+    print(f"Google API Key configured: {'Yes' if settings.GEMINI_API_KEY else 'No'}")
+    print(f"Bright Data API Token configured: {'Yes' if settings.BRIGHTDATA_API_TOKEN else 'No'}")
+    workers = settings.WORKERS or os.cpu_count()
+    # A single worker serves this already-imported app; re-importing "app.main" would build a
+    # second listener thread, model and caches. Multiple workers need the import string.
+    # uvloop/httptools come with uvicorn[standard]
+    uvicorn.run(
+        app if workers == 1 else "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    ) 
\ No newline at end of file
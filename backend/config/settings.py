@@ -21,6 +21,8 @@ class Settings:
     HOST: str = os.getenv('HOST', '0.0.0.0')
     PORT: int = int(os.getenv('PORT', '8001'))
     DEBUG: bool = os.getenv('DEBUG', 'False').lower() == 'true'
+    WORKERS: int = int(os.getenv('WORKERS', '1'))  # 0 = one per CPU core
+    LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO').upper()
     
     # Application Configuration
     APP_NAME: str = "BrightData MCP × Google ADK Platform"
@@ -31,6 +33,9 @@ class Settings:
     REQUEST_TIMEOUT: int = int(os.getenv('REQUEST_TIMEOUT', '90'))
     QUICK_TIMEOUT: int = int(os.getenv('QUICK_TIMEOUT', '30'))
     
+    # Startup Configuration
+    WARMUP_ON_STARTUP: bool = os.getenv('WARMUP_ON_STARTUP', 'True').lower() == 'true'
+    
     # CORS Configuration
     ALLOWED_ORIGINS: list = ["*"]  # Configure for production
     
@@ -4,152 +4,395 @@ Handles connection lifecycle, process management, and error recovery
 """
 
 import os
+import time
 import asyncio
-import subprocess
-import signal
-from typing import Optional, Dict, Any
+import functools
+import logging
+import itertools
+import zlib
+from types import MappingProxyType
+from typing import Optional, Any, Mapping, List, Union
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.mcp_tool.mcp_session_manager import SseConnectionParams
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
 
+logger = logging.getLogger(__name__)
+
+# Reconnect backoff bounds after a failed connection attempt (seconds)
+MCP_RETRY_INITIAL_BACKOFF = 0.5
+MCP_RETRY_MAX_BACKOFF = 30.0
+
+# Number of BrightData MCP children to spread tool calls across (1 = single shared child)
+MCP_POOL_SIZE = max(1, int(os.getenv('MCP_POOL_SIZE', '1')))
+
+# Seconds connect() waits for every MCP child to answer list_tools; slower handshakes
+# (e.g. a cold npx download) keep running in the background instead of failing
+MCP_HANDSHAKE_TIMEOUT = float(os.getenv('MCP_HANDSHAKE_TIMEOUT', '30'))
+
+# Upper bound on closing the MCP session(s) so a stuck child can't hold up shutdown or reconnect
+MCP_CLOSE_TIMEOUT = 5.0
+
+# Seconds a listed tool set is reused before asking the MCP server again
+MCP_TOOLS_CACHE_TTL = 60.0
+
+# BrightData's MCP server doesn't implement list_roots; these failures don't affect tool calls
+_LIST_ROOTS_ERROR_CODE = -32600
+_KNOWN_ERROR_MARKERS = ("List roots not supported", "MCP error -32600")
+
+# SSE endpoint of a shared BrightData MCP server; every worker connects to it instead of spawning npx
+MCP_SERVER_URL = os.getenv('BRIGHTDATA_MCP_URL')
+
+# (server variable, source variable, default) forwarded from our environment to the MCP child
+_MCP_ENV_KEYS = (
+    ("API_TOKEN", "BRIGHTDATA_API_TOKEN", None),
+    ("BRIGHTDATA_API_TOKEN", "BRIGHTDATA_API_TOKEN", None),  # Backup key
+    ("BROWSER_AUTH", "BROWSER_AUTH", None),
+    ("WEB_UNLOCKER_ZONE", "WEB_UNLOCKER_ZONE", "web_unlocker1"),
+    ("NODE_ENV", "NODE_ENV", "production"),
+)
+
+@functools.lru_cache(maxsize=1)
+def _build_mcp_environment() -> Mapping[str, str]:
+    """Build the MCP server environment once - env vars don't change after startup"""
+    env = os.environ
+    # Skip unset variables that have no default
+    mcp_env = {
+        dest: value
+        for dest, src, default in _MCP_ENV_KEYS
+        if (value := env.get(src, default)) is not None
+    }
+    mcp_env["PATH"] = env.get("PATH", "")
+    mcp_env["NPM_CONFIG_REGISTRY"] = "https://registry.npmjs.org/"
+    # A 512 MB V8 heap is plenty for the stdio bridge and keeps per-worker RSS down
+    mcp_env["NODE_OPTIONS"] = env.get("MCP_NODE_OPTIONS", "--max-old-space-size=512 --no-warnings --no-deprecation")
+    return MappingProxyType(mcp_env)
+
+@functools.lru_cache(maxsize=1)
+def _build_connection_params() -> Union[StdioServerParameters, SseConnectionParams]:
+    """Build the MCP connection parameters once so reconnects skip env assembly"""
+    if MCP_SERVER_URL:
+        return SseConnectionParams(url=MCP_SERVER_URL)
+    return StdioServerParameters(
+        command='npx',
+        args=["-y", "@brightdata/mcp"],
+        env=dict(_build_mcp_environment())
+    )
+
+def _is_known_mcp_warning(error: Exception) -> bool:
+    """Match the JSON-RPC code on McpError, falling back to the message for wrapped errors"""
+    if getattr(getattr(error, 'error', None), 'code', None) == _LIST_ROOTS_ERROR_CODE:
+        return True
+    msg = str(error)
+    return any(marker in msg for marker in _KNOWN_ERROR_MARKERS)
+
+class CachedToolset(BaseToolset):
+    """Wraps one MCP toolset and reuses its tool list for MCP_TOOLS_CACHE_TTL seconds"""
+    
+    def __init__(self, toolset: MCPToolset):
+        super().__init__()
+        self._toolset = toolset
+        self._tools: Optional[List[Any]] = None
+        self._tools_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+    
+    async def get_tools(self, readonly_context=None):
+        # ADK asks on every LLM step; without this each step is a list_tools round trip.
+        # The MCP toolset has no tool_filter, so the list doesn't depend on the context.
+        if self._tools is not None and time.monotonic() - self._tools_at < MCP_TOOLS_CACHE_TTL:
+            return self._tools
+        
+        async with self._refresh_lock:
+            # Concurrent misses share one refresh
+            if self._tools is None or time.monotonic() - self._tools_at >= MCP_TOOLS_CACHE_TTL:
+                self._tools = await self._toolset.get_tools(readonly_context)
+                self._tools_at = time.monotonic()
+        return self._tools
+    
+    async def close(self):
+        self._tools = None
+        await self._toolset.close()
+
+class MCPToolsetPool(BaseToolset):
+    """Spreads agent invocations across several MCP toolsets, one stdio child each"""
+    
+    def __init__(self, toolsets: List[BaseToolset]):
+        super().__init__()
+        self._toolsets = toolsets
+        self._next_toolset = itertools.cycle(toolsets)
+    
+    async def get_tools(self, readonly_context=None):
+        return await self._pick(readonly_context).get_tools(readonly_context)
+    
+    def _pick(self, readonly_context) -> BaseToolset:
+        """Pin every LLM step of one invocation to the same child"""
+        # ADK resolves tools on every LLM step; chained scraping_browser_* calls
+        # (navigate -> click -> get_text) only work against the child holding the browser
+        invocation_id = getattr(readonly_context, 'invocation_id', None)
+        if not invocation_id:
+            return next(self._next_toolset)
+        return self._toolsets[zlib.crc32(invocation_id.encode()) % len(self._toolsets)]
+    
+    @property
+    def toolsets(self) -> List[BaseToolset]:
+        """The pooled toolsets, one per stdio child"""
+        return self._toolsets
+    
+    async def close(self):
+        for toolset in self._toolsets:
+            try:
+                await toolset.close()
+            except Exception as e:
+                logger.warning("⚠️ Pooled toolset close warning: %s", e)
+
+class ReconnectingToolset(BaseToolset):
+    """The toolset handed to the Agent: every lookup goes through the manager's connect/backoff"""
+    
+    def __init__(self, manager: "MCPConnectionManager"):
+        super().__init__()
+        self._manager = manager
+    
+    async def get_tools(self, readonly_context=None):
+        # Lock-free while connected; waits for a handshake still in flight, and after a
+        # failure retries at most once per backoff window
+        toolset = await self._manager.connect()
+        if toolset is None:
+            return []
+        
+        try:
+            return await toolset.get_tools(readonly_context)
+        except Exception as e:
+            logger.warning("⚠️ MCP tool listing failed, reconnecting after backoff: %s", e)
+            await self._manager.mark_failed(toolset)
+            return []
+    
+    async def close(self):
+        # The manager owns the MCP session(s) and closes them in disconnect()
+        pass
+
 class MCPConnectionManager:
     """Manages MCP server connections with proper lifecycle management"""
     
     def __init__(self):
-        self._toolset: Optional[MCPToolset] = None
-        self._process: Optional[subprocess.Popen] = None
-        self._connection_params: Optional[StdioServerParameters] = None
+        self._agent_toolset = ReconnectingToolset(self)
+        self._toolset: Optional[BaseToolset] = None
+        self._connection_params: Optional[Union[StdioServerParameters, SseConnectionParams]] = None
+        self._pending_handshake: Optional[asyncio.Task] = None
+        self._session_owners: List[asyncio.Task] = []
+        self._closing: Optional[asyncio.Event] = None
         self._is_connected = False
         self._connection_lock = asyncio.Lock()
-        self._connection_attempted = False
+        self._next_retry_at = 0.0
+        self._backoff = MCP_RETRY_INITIAL_BACKOFF
         
-    async def connect(self) -> Optional[MCPToolset]:
+    async def connect(self) -> Optional[BaseToolset]:
         """Connect to MCP server with proper process management"""
+        # Lock-free fast path for the steady state; single attribute reads are atomic
+        toolset = self._toolset
+        if self._is_connected and toolset is not None:
+            return toolset
+        if self._pending_handshake is not None:
+            return await self._await_handshake()
+        
         async with self._connection_lock:
-            # Always reuse existing connection if available
+            # Re-check in case another caller connected while we waited for the lock
             if self._is_connected and self._toolset:
-                print("♻️ Reusing existing MCP connection")
+                logger.debug("♻️ Reusing existing MCP connection")
                 return self._toolset
+            if self._pending_handshake is not None:
+                return await self._await_handshake()
             
-            # Prevent multiple connection attempts
-            if self._connection_attempted and not self._is_connected:
-                print("⚠️ Previous connection attempt failed, returning None")
+            # Back off after a failed attempt instead of retrying on every request
+            if time.monotonic() < self._next_retry_at:
+                logger.debug("⚠️ Previous connection attempt failed, retrying in %.1fs", self._next_retry_at - time.monotonic())
                 return None
             
-            self._connection_attempted = True
-            
             try:
-                # Validate environment variables
-                api_token = os.getenv('BRIGHTDATA_API_TOKEN')
-                browser_auth = os.getenv('BROWSER_AUTH')
-                
-                if not api_token:
-                    raise ValueError("BRIGHTDATA_API_TOKEN not found in environment")
-                if not browser_auth:
-                    raise ValueError("BROWSER_AUTH not found in environment")
-                
-                print("🔐 Environment validation passed")
-                
-                # Create environment for MCP server
-                mcp_env = self._create_mcp_environment()
+                if MCP_SERVER_URL:
+                    # The shared server holds the BrightData credentials itself
+                    logger.info("🔗 Using shared MCP server at %s", MCP_SERVER_URL)
+                else:
+                    # Validate environment variables
+                    api_token = os.getenv('BRIGHTDATA_API_TOKEN')
+                    browser_auth = os.getenv('BROWSER_AUTH')
+                    
+                    if not api_token:
+                        raise ValueError("BRIGHTDATA_API_TOKEN not found in environment")
+                    if not browser_auth:
+                        raise ValueError("BROWSER_AUTH not found in environment")
+                    
+                    logger.debug("🔐 Environment validation passed")
                 
-                # Create connection parameters only once
-                if not self._connection_params:
-                    self._connection_params = StdioServerParameters(
-                        command='npx',
-                        args=["-y", "@brightdata/mcp"],
-                        env=mcp_env
-                    )
+                self._connection_params = _build_connection_params()
                 
-                print("🚀 Creating MCP toolset...")
+                logger.info("🚀 Creating MCP toolset (pool size %s)...", MCP_POOL_SIZE)
                 
                 # Create the toolset only once
                 if not self._toolset:
-                    self._toolset = MCPToolset(connection_params=self._connection_params)
+                    # Build off the event loop so other requests keep flowing meanwhile; the worker
+                    # thread has no running loop, so construction can't trip nested-loop errors
+                    self._toolset = await asyncio.to_thread(self._create_toolset)
                 
-                # Test connection briefly
-                await self._test_connection()
+                # Fail fast on a dead or hung child instead of inside the first user request
+                if not await self._test_connection():
+                    # Still connecting; later callers wait for the background handshake
+                    return None
                 
                 self._is_connected = True
-                print("✅ MCP connection established successfully")
+                self._backoff = MCP_RETRY_INITIAL_BACKOFF
+                logger.info("✅ MCP connection established successfully")
                 
                 return self._toolset
                 
             except Exception as e:
-                print(f"❌ MCP connection failed: {e}")
+                logger.error("❌ MCP connection failed: %s", e)
                 
-                # Handle specific known errors
-                if "List roots not supported" in str(e) or "MCP error -32600" in str(e):
-                    print("ℹ️ Note: List roots error is expected and non-critical")
-                    # The connection might still work for actual tool calls
-                    if self._toolset:
-                        self._is_connected = True
-                        print("✅ Proceeding with MCP connection despite list_roots warning")
-                        return self._toolset
-                
-                # Don't cleanup on known errors, just mark as connected
-                if self._toolset and ("List roots not supported" in str(e) or "MCP error -32600" in str(e)):
+                # Known list_roots errors are non-critical: tool calls still work, so keep the toolset
+                if self._toolset and _is_known_mcp_warning(e):
                     self._is_connected = True
+                    logger.info("✅ Proceeding with MCP connection despite list_roots warning")
                     return self._toolset
                 
                 await self._cleanup()
+                self._schedule_retry()
                 return None
     
-    def _create_mcp_environment(self) -> Dict[str, str]:
-        """Create comprehensive environment for MCP server"""
-        base_env = {
-            "API_TOKEN": os.getenv('BRIGHTDATA_API_TOKEN'),
-            "BRIGHTDATA_API_TOKEN": os.getenv('BRIGHTDATA_API_TOKEN'),  # Backup key
-            "BROWSER_AUTH": os.getenv('BROWSER_AUTH'),
-            "WEB_UNLOCKER_ZONE": os.getenv('WEB_UNLOCKER_ZONE', 'web_unlocker1'),
-            "NODE_ENV": os.getenv('NODE_ENV', 'production'),
-            "PATH": os.environ.get("PATH", ""),
-            "NPM_CONFIG_REGISTRY": "https://registry.npmjs.org/",
-            "NODE_OPTIONS": "--max-old-space-size=2048"
-        }
+    def _schedule_retry(self):
+        """Hold off the next connection attempt, doubling the wait after each failure"""
+        self._next_retry_at = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, MCP_RETRY_MAX_BACKOFF)
+    
+    async def mark_failed(self, toolset: BaseToolset):
+        """Drop a connection that stopped answering and back off before reconnecting"""
+        async with self._connection_lock:
+            # Another caller may already have replaced it
+            if self._toolset is not toolset:
+                return
+            await self._cleanup()
+            self._schedule_retry()
+    
+    async def warm(self) -> Optional[BaseToolset]:
+        """Connect ahead of traffic; connect() spawns every child and completes its handshake"""
+        return await self.connect()
+    
+    def _create_toolset(self) -> BaseToolset:
+        """Create a single cached MCP toolset, or a pool of them when MCP_POOL_SIZE > 1"""
+        if MCP_POOL_SIZE == 1:
+            return CachedToolset(MCPToolset(connection_params=self._connection_params))
+        return MCPToolsetPool([
+            CachedToolset(MCPToolset(connection_params=self._connection_params))
+            for _ in range(MCP_POOL_SIZE)
+        ])
+    
+    async def _await_handshake(self) -> Optional[BaseToolset]:
+        """Wait (bounded) for a handshake finishing in the background, then return its connection"""
+        # asyncio.wait neither raises nor cancels, so one impatient caller can't kill the handshake
+        await asyncio.wait({self._pending_handshake}, timeout=MCP_HANDSHAKE_TIMEOUT)
+        return self.toolset
+    
+    async def _test_connection(self) -> bool:
+        """Ping every MCP child with list_tools; False if the handshake is still running, raises if it failed"""
+        if not self._toolset:
+            raise RuntimeError("Toolset not created")
+        
+        members = self._toolset.toolsets if isinstance(self._toolset, MCPToolsetPool) else [self._toolset]
+        # Tool listing is what actually spawns each child, so start them all together,
+        # each in the task that will later close its session
+        loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        listed = [loop.create_future() for _ in members]
+        self._session_owners = [
+            asyncio.create_task(self._own_session(member, done, self._closing))
+            for member, done in zip(members, listed)
+        ]
+        handshake = asyncio.gather(*listed)
+        try:
+            # Shielded: a cold npx download can outlast the timeout, and cancelling would kill it
+            tool_lists = await asyncio.wait_for(asyncio.shield(handshake), timeout=MCP_HANDSHAKE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("⏳ MCP handshake still running after %.0fs, finishing it in the background", MCP_HANDSHAKE_TIMEOUT)
+            self._pending_handshake = asyncio.create_task(self._finish_handshake(handshake))
+            return False
         
-        # Filter out None values
-        return {k: v for k, v in base_env.items() if v is not None}
+        # The lists are now cached on each member, so the first user request skips list_tools
+        logger.info("🔍 MCP connection test passed: %s process(es), %s tools", len(members), len(tool_lists[0]))
+        return True
     
-    async def _test_connection(self):
-        """Test MCP connection health"""
+    async def _own_session(self, member: BaseToolset, listed: asyncio.Future, closing: asyncio.Event):
+        """Open one MCP session, hold it until closing is set, then close it from this same task"""
+        # The MCP client's anyio cancel scopes must be exited by the task that entered them
         try:
-            # Basic validation that toolset was created
-            if not self._toolset:
-                raise RuntimeError("Toolset not created")
-            
-            # Additional validation can be added here
-            print("🔍 MCP connection test passed")
-            
-        except Exception as e:
-            print(f"⚠️ MCP connection test warning: {e}")
-            # Don't fail completely on test warnings
+            try:
+                listed.set_result(await member.get_tools())
+            except Exception as e:
+                # connect() decides whether this is fatal; keep the session until it says so
+                listed.set_exception(e)
+            await closing.wait()
+        finally:
+            if not listed.done():
+                listed.cancel()
+            try:
+                # Closes the MCP client session, which terminates its stdio child and
+                # returns as soon as it has exited
+                async with asyncio.timeout(MCP_CLOSE_TIMEOUT):
+                    await member.close()
+            except TimeoutError:
+                logger.warning("⚠️ MCP session close timed out after %.0fs", MCP_CLOSE_TIMEOUT)
+            except Exception as e:
+                logger.warning("⚠️ Toolset close warning: %s", e)
+    
+    async def _finish_handshake(self, handshake: asyncio.Future):
+        """Settle a handshake that outlived MCP_HANDSHAKE_TIMEOUT, the same way connect() would"""
+        await asyncio.wait({handshake})
+        # The connection was torn down while the handshake was running
+        if handshake.cancelled():
+            return
+        error = handshake.exception()
+        if error is not None and not (self._toolset and _is_known_mcp_warning(error)):
+            logger.error("❌ Background MCP handshake failed: %s", error)
+            # Cleared first so _cleanup() closes the sessions instead of cancelling this task
+            self._pending_handshake = None
+            await self._cleanup()
+            self._schedule_retry()
+            return
+        if error is not None:
+            logger.info("✅ Proceeding with MCP connection despite list_roots warning")
+        else:
+            logger.info("🔍 Background MCP handshake finished: %s tools", len(handshake.result()[0]))
+        self._is_connected = True
+        self._backoff = MCP_RETRY_INITIAL_BACKOFF
+        self._pending_handshake = None
     
     async def disconnect(self):
         """Properly disconnect and cleanup MCP resources"""
         async with self._connection_lock:
             await self._cleanup()
+            # An explicit disconnect allows an immediate reconnect
+            self._next_retry_at = 0.0
+            self._backoff = MCP_RETRY_INITIAL_BACKOFF
     
     async def _cleanup(self):
         """Internal cleanup method"""
         try:
-            if self._process:
-                try:
-                    self._process.terminate()
-                    # Give it a moment to terminate gracefully
-                    await asyncio.sleep(1)
-                    if self._process.poll() is None:
-                        self._process.kill()
-                    print("🧹 MCP process cleaned up")
-                except Exception as e:
-                    print(f"⚠️ Process cleanup warning: {e}")
+            owners, self._session_owners = self._session_owners, []
+            if owners:
+                if self._pending_handshake is not None:
+                    # A handshake still in flight is interrupted; its owners close what they opened
+                    for owner in owners:
+                        owner.cancel()
+                else:
+                    self._closing.set()
+                # Each owner closes its own session, bounded by MCP_CLOSE_TIMEOUT
+                await asyncio.wait(owners)
+                logger.info("🧹 MCP toolset closed")
             
+            self._pending_handshake = None
+            self._closing = None
             self._toolset = None
-            self._process = None
             self._connection_params = None
             self._is_connected = False
-            self._connection_attempted = False
             
         except Exception as e:
-            print(f"⚠️ Cleanup warning: {e}")
+            logger.warning("⚠️ Cleanup warning: %s", e)
     
     @property
     def is_connected(self) -> bool:
@@ -157,13 +400,18 @@ class MCPConnectionManager:
         return self._is_connected and self._toolset is not None
     
     @property
-    def toolset(self) -> Optional[MCPToolset]:
+    def toolset(self) -> Optional[BaseToolset]:
         """Get the current toolset"""
         return self._toolset if self._is_connected else None
+    
+    @property
+    def agent_toolset(self) -> ReconnectingToolset:
+        """Toolset for the Agent that stays valid across reconnects"""
+        return self._agent_toolset
 
 # Singleton instance
 _mcp_manager = MCPConnectionManager()
 
-async def get_mcp_manager() -> MCPConnectionManager:
+def get_mcp_manager() -> MCPConnectionManager:
     """Get the singleton MCP manager instance"""
     return _mcp_manager 
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Redis-backed ADK Session Service
+Shares conversation state across uvicorn workers and containers
+"""
+
+import time
+import uuid
+from typing import Any, Optional
+
+import redis.asyncio as redis
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+
+class RedisSessionService(BaseSessionService):
+    """Stores each ADK session as one JSON blob in Redis with a sliding TTL"""
+
+    def __init__(self, client: redis.Redis, ttl_seconds: int = 3600):
+        self._redis = client
+        self._ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key(app_name: str, user_id: str, session_id: str) -> str:
+        return f"adk:session:{app_name}:{user_id}:{session_id}"
+
+    async def _save(self, session: Session):
+        """Write the session and refresh its TTL"""
+        await self._redis.set(
+            self._key(session.app_name, session.user_id, session.id),
+            session.model_dump_json(),
+            ex=self._ttl_seconds
+        )
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        """Create a new session and store it in Redis"""
+        session = Session(
+            id=session_id or str(uuid.uuid4()),
+            app_name=app_name,
+            user_id=user_id,
+            state=state or {},
+            last_update_time=time.time(),
+        )
+        await self._save(session)
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        """Load a session from Redis, optionally trimming its event history"""
+        raw = await self._redis.get(self._key(app_name, user_id, session_id))
+        if raw is None:
+            return None
+
+        session = Session.model_validate_json(raw)
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [
+                    event for event in session.events
+                    if event.timestamp >= config.after_timestamp
+                ]
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        """List a user's sessions without their event history"""
+        sessions = []
+        async for key in self._redis.scan_iter(match=self._key(app_name, user_id, "*")):
+            raw = await self._redis.get(key)
+            if raw is None:
+                continue
+            session = Session.model_validate_json(raw)
+            session.events = []
+            sessions.append(session)
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        """Delete a session from Redis"""
+        await self._redis.delete(self._key(app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        """Apply the event to the session and persist the result"""
+        event = await super().append_event(session=session, event=event)
+        if not event.partial:
+            session.last_update_time = event.timestamp
+            await self._save(session)
+        return event
+
+    async def close(self):
+        """Close the Redis connection pool"""
+        await self._redis.aclose()